@@ -14,9 +14,39 @@ configs = {
         'port': 3306,
         'user': 'root',
         'password': '123456',
-        'db': 'blog'
+        'db': 'blog',
+        'maxsize': 10,
+        'minsize': 1,
+        # seconds after which an idle connection is reopened, -1 means never
+        'pool_recycle': 3600,
+        # seconds to wait for a free connection before answering 503
+        'acquire_timeout': 5,
+        # the read replicas, e.g. [{'host': '10.0.0.2'}], each overriding the settings above
+        'replicas': [],
+        # seconds during which the reads of a user go to the primary after the user's own writes
+        'read_your_writes': 5,
+        # EXPLAIN every distinct query once and warn of the full scans and filesorts (debugging)
+        'explain': False
     },
     'session': {
         'secret': 'blog'
+    },
+    'templates': {
+        # the directory of the compiled templates when not debug, None: a directory under the system temp dir
+        'bytecode_cache_dir': None
+    },
+    'row_counter': {
+        # 'memory': in-process counters, 'table': the `row_counter` table (several processes), None: COUNT queries
+        'backend': 'memory'
+    },
+    'etag': {
+        # the ETags of the listings from the table versions of this process, without rendering the body:
+        # only right if this process is the only writer, set False with several processes to hash the bodies
+        'table_versions': True
+    },
+    'query_cache': {
+        'enabled': False,
+        'maxsize': 1024,
+        'ttl': 60
     }
 }
@@ -0,0 +1,4 @@
+-- pre-rendered markdown of blog.content, filled by `python3 -m www.backfill` for existing rows
+ALTER TABLE blog
+  ADD COLUMN `html_content` MEDIUMTEXT NOT NULL
+  AFTER `content`;
@@ -0,0 +1,9 @@
+-- row counters shared by all the processes (configs.row_counter.backend = 'table'),
+-- seeded by the application at startup
+CREATE TABLE row_counter (
+  `table_name` VARCHAR(50)  NOT NULL,
+  `num`        BIGINT       NOT NULL,
+  PRIMARY KEY (`table_name`)
+)
+  ENGINE = innodb
+  DEFAULT CHARSET = utf8;
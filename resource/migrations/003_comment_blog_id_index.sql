@@ -0,0 +1,3 @@
+-- the comments of a blog by created_at (get_blog) without a full scan and a filesort
+ALTER TABLE comment
+  ADD KEY `idx_blog_id_created_at` (`blog_id`, `created_at`);
@@ -21,6 +21,7 @@ CREATE TABLE blog (
   `name`       VARCHAR(50)  NOT NULL,
   `summary`    VARCHAR(200) NOT NULL,
   `content`    MEDIUMTEXT   NOT NULL,
+  `html_content` MEDIUMTEXT NOT NULL,
   `created_at` REAL         NOT NULL,
   KEY `idx_created_at` (`created_at`),
   PRIMARY KEY (`id`)
@@ -37,7 +38,16 @@ CREATE TABLE comment (
   `content`    MEDIUMTEXT   NOT NULL,
   `created_at` REAL         NOT NULL,
   KEY `idx_created_at` (`created_at`),
+  KEY `idx_blog_id_created_at` (`blog_id`, `created_at`),
   PRIMARY KEY (`id`)
+)
+  ENGINE = innodb
+  DEFAULT CHARSET = utf8;
+
+CREATE TABLE row_counter (
+  `table_name` VARCHAR(50)  NOT NULL,
+  `num`        BIGINT       NOT NULL,
+  PRIMARY KEY (`table_name`)
 )
   ENGINE = innodb
   DEFAULT CHARSET = utf8;
\ No newline at end of file
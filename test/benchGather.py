@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = 'Nate_River'
+
+'''
+benchmark the latency of the count + page queries of /api/blogs, one after the other and by orm.gather,
+against a database answering every select in ROUND_TRIP seconds
+
+usage: PYTHONPATH=. python3 test/benchGather.py
+'''
+
+import asyncio
+import time
+from www import orm
+from www.models import Blog
+
+N = 50
+ROUND_TRIP = 0.005
+
+
+async def select(sql, args, size=None):
+    # stands for the database: no rows, after one round trip
+    await asyncio.sleep(ROUND_TRIP)
+    return dict(_num_=0) if size == 1 else []
+
+
+async def sequential():
+    await Blog.findnumber(selectField='id')
+    await Blog.findall(orderBy='created_at desc', limit=(0, 10), fields='listing')
+
+
+async def concurrent():
+    await orm.gather(
+        Blog.findnumber(selectField='id'),
+        Blog.findall(orderBy='created_at desc', limit=(0, 10), fields='listing'))
+
+
+async def bench(name, fn):
+    best = None
+    for i in range(N):
+        start = time.perf_counter()
+        await fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print('%-24s %8.2f ms' % (name, best * 1000))
+
+
+async def main():
+    orm.select = select
+    await bench('count, then page', sequential)
+    await bench('gather(count, page)', concurrent)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
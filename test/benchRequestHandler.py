@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = 'Nate_River'
+
+'''
+benchmark RequestHandler: per-call dispatch overhead of every kind of handler signature
+
+usage: PYTHONPATH=. python3 test/benchRequestHandler.py
+'''
+
+import asyncio
+import time
+from aiohttp.test_utils import make_mocked_request
+from www.coreweb import RequestHandler, get
+
+N = 50000
+
+
+@get('/register')
+async def no_arg():
+    return None
+
+
+@get('/blog/{id}')
+async def path_only(id):
+    return None
+
+
+@get('/api/blogs')
+async def query_only(*, page='1'):
+    return None
+
+
+@get('/blog/{id}')
+async def path_and_request(id, request):
+    return None
+
+
+async def bench(name, fn, request, repeat=5):
+    handler = RequestHandler(None, fn)
+    best = None
+    for r in range(repeat):
+        start = time.perf_counter()
+        for i in range(N):
+            await handler(request)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print('%-20s %8.2f us/call' % (name, best / N * 1e6))
+
+
+async def main():
+    await bench('no arg', no_arg, make_mocked_request('GET', '/register'))
+    await bench('path only', path_only, make_mocked_request('GET', '/blog/1', match_info={'id': '1'}))
+    await bench('query only', query_only, make_mocked_request('GET', '/api/blogs?page=2'))
+    await bench('path and request', path_and_request,
+                make_mocked_request('GET', '/blog/1', match_info={'id': '1'}))
+
+
+if __name__ == '__main__':
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(main())
+    loop.close()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = 'Nate_River'
+
+'''
+benchmark the JSON serialization of a /api/blogs payload of 1000 blogs
+
+usage: PYTHONPATH=. python3 test/benchSerializer.py
+'''
+
+import json
+import time
+from www.models import Blog, Page
+from www import serializer
+
+N = 20
+
+
+def make_payload():
+    blogs = [Blog(id='%050d' % i, user_id='u', user_name='Near', user_image='http://example.com/u.png',
+                  name='blog %s' % i, summary='summary of the blog %s' % i, content='正文 content ' * 400,
+                  html_content='<p>%s</p>' % ('正文 content ' * 400), created_at=1463731200.0 + i)
+             for i in range(1000)]
+    return blogs, Page(100000, 1, 1000)
+
+
+def load_listing(blogs):
+    # the partial blogs returned by Blog.findall(fields='listing')
+    fields = Blog.__projections__['listing']
+    return [Blog(**{f: b[f] for f in fields}) for b in blogs]
+
+
+def bench(name, fn):
+    best = None
+    for i in range(N):
+        start = time.perf_counter()
+        body = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print('%-32s %8.2f ms %10s bytes' % (name, best * 1000, len(body)))
+
+
+if __name__ == '__main__':
+    blogs, page = make_payload()
+    backend = 'orjson' if serializer.orjson else 'ujson' if serializer.ujson else 'json'
+    bench('json.dumps, full blogs', lambda: json.dumps(
+        dict(page=page, blogs=blogs), ensure_ascii=False, default=lambda o: o.__dict__).encode('utf-8'))
+    bench('%s, full blogs' % backend, lambda: serializer.dumps(dict(page=page, blogs=blogs)))
+    listing = load_listing(blogs)
+    bench('%s, listing fields' % backend, lambda: serializer.dumps(dict(page=page, blogs=listing)))
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = 'Nate_River'
+
+'''
+backfill the pre-rendered html of the blogs saved before html_content existed.
+
+usage: python3 -m www.backfill
+'''
+
+import asyncio, logging
+from conf.config import configs
+from www.orm import create_connection_pool
+from www.models import Blog
+from www.handlers import render_markdown
+
+logging.basicConfig(level=logging.INFO)
+
+
+async def backfill_blog_html(batch_size=100):
+    """render the content of every blog whose html_content is empty"""
+    total = 0
+    async for blogs in Blog.iterate(where="`html_content`=''", batch_size=batch_size):
+        for blog in blogs:
+            blog.html_content = render_markdown(blog.content)
+            await blog.update()
+        total += len(blogs)
+        logging.info('backfilled html of %s blogs' % total)
+    return total
+
+
+async def main(loop):
+    await create_connection_pool(loop=loop, **configs.db)
+    total = await backfill_blog_html()
+    logging.info('backfill done: %s blogs' % total)
+
+
+if __name__ == '__main__':
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(main(loop))
+    loop.close()
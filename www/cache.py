@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = 'Nate_River'
+
+'''
+in-process caches.
+'''
+
+import sys
+import time
+import asyncio
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """LRU cache bounded by entry count and optionally by total size and entry age."""
+
+    def __init__(self, maxsize=128, maxbytes=None, ttl=None, sizeof=sys.getsizeof):
+        """
+        :param maxsize:     max number of entries
+        :param maxbytes:    max total size of the cached values (measured by sizeof), None means unbounded
+        :param ttl:         default seconds an entry stays valid, None means forever
+        :param sizeof:      function measuring the size of a value
+        """
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._sizeof = sizeof
+        self._bytes = 0
+        # key ==> (value, size, expires)
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        value, size, expires = item
+        if expires is not None and expires < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value, ttl=None):
+        size = self._sizeof(value) if self.maxbytes is not None else 0
+        if key in self._data:
+            self._remove(key)
+        if self.maxbytes is not None and size > self.maxbytes:
+            # never let a single value flush the whole cache
+            return
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl else None
+        self._data[key] = (value, size, expires)
+        self._bytes += size
+        while len(self._data) > self.maxsize or (self.maxbytes is not None and self._bytes > self.maxbytes):
+            k, (v, s, e) = self._data.popitem(last=False)
+            self._bytes -= s
+
+    def pop(self, key, default=None):
+        if key not in self._data:
+            return default
+        return self._remove(key)
+
+    def clear(self):
+        self._data.clear()
+        self._bytes = 0
+
+    def stats(self):
+        return dict(size=len(self._data), bytes=self._bytes, hits=self.hits, misses=self.misses)
+
+    def _remove(self, key):
+        value, size, expires = self._data.pop(key)
+        self._bytes -= size
+        return value
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+
+class PageCache(object):
+    """cache of the rendered pages keyed by path and query string, invalidated by path"""
+
+    def __init__(self, maxsize=1024, maxbytes=64 * 1024 * 1024):
+        # (path, version of the path, query string) ==> page
+        self._cache = LRUCache(maxsize=maxsize, maxbytes=maxbytes, sizeof=lambda page: len(page[-1]))
+        # path ==> version, bumped by invalidate()
+        self._versions = dict()
+        # key ==> future of the page being rendered
+        self._rendering = dict()
+
+    async def get_or_render(self, path, query_string, ttl, render):
+        """return the cached page, or the page rendered by the coroutine function render
+            only one render runs at a time for a key, the concurrent callers wait for its page.
+            render returns None for an uncacheable page, then the waiting callers get None too.
+        """
+        key = (path, self._versions.get(path, 0), query_string)
+        page = self._cache.get(key)
+        if page is not None:
+            return page
+        future = self._rendering.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+        future = asyncio.get_event_loop().create_future()
+        self._rendering[key] = future
+        page = None
+        try:
+            page = await render()
+            if page is not None:
+                self._cache.put(key, page, ttl)
+        finally:
+            future.set_result(page)
+            del self._rendering[key]
+        return page
+
+    def invalidate(self, *paths):
+        """drop the cached pages of the paths, whatever the query string"""
+        for path in paths:
+            self._versions[path] = self._versions.get(path, 0) + 1
+
+    def stats(self):
+        return self._cache.stats()
+
+
+# the cached pages for the anonymous visitors, see middleware.page_cache_factory
+page_cache = PageCache()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = 'Nate_River'
+
+'''
+response compression: gzip, and brotli if the brotli module is installed.
+
+precompress the static files (writes the .gz/.br siblings served by compress_factory):
+    python3 -m www.compress
+'''
+
+import gzip
+import logging
+import os
+from www.coreweb import STATIC_ROOT
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# the bodies smaller than this are not worth compressing
+MIN_SIZE = 1024
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'image/svg+xml')
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.html', '.svg', '.otf', '.ttf', '.eot')
+# content coding ==> file extension of the precompressed static files, by preference
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')] if brotli else [('gzip', '.gz')]
+
+
+def accepted_encodings(request):
+    """return the content codings accepted by the request"""
+    accepted = set()
+    for item in request.headers.get('Accept-Encoding', '').split(','):
+        parts = item.split(';')
+        coding = parts[0].strip().lower()
+        q = 1.0
+        for param in parts[1:]:
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding and q > 0:
+            accepted.add(coding)
+    return accepted
+
+
+def choose_encoding(request):
+    accepted = accepted_encodings(request)
+    for coding, ext in ENCODINGS:
+        if coding in accepted:
+            return coding, ext
+    return None, None
+
+
+def find_precompressed(request):
+    """return the path of the precompressed sibling of the requested static file and its content coding"""
+    accepted = accepted_encodings(request)
+    path = os.path.normpath(os.path.join(STATIC_ROOT, request.path[len('/static/'):]))
+    if not path.startswith(STATIC_ROOT + os.sep):
+        return None, None
+    for coding, ext in ENCODINGS:
+        if coding in accepted and os.path.isfile(path + ext):
+            return path + ext, coding
+    return None, None
+
+
+def compress(data, coding):
+    if coding == 'br':
+        return brotli.compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def is_compressible(content_type):
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def precompress_static(root=STATIC_ROOT):
+    """write the compressed siblings of the static files, skipping those already up to date"""
+    count = 0
+    for dirpath, dirnames, filenames in os.walk(root):
+        for filename in filenames:
+            if not filename.endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            path = os.path.join(dirpath, filename)
+            if os.path.getsize(path) < MIN_SIZE:
+                continue
+            with open(path, 'rb') as f:
+                data = None
+                for coding, ext in ENCODINGS:
+                    target = path + ext
+                    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+                        continue
+                    if data is None:
+                        data = f.read()
+                    with open(target, 'wb') as out:
+                        out.write(brotli.compress(data) if coding == 'br' else gzip.compress(data, compresslevel=9))
+                    logging.info('compressed %s' % target)
+                    count += 1
+    return count
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    logging.info('precompressed %s static files' % precompress_static())
@@ -10,7 +10,6 @@ async core web framework.
 import logging
 import functools, inspect, os
 import asyncio
-from urllib import parse
 from aiohttp import web
 from www.apis import APIError
 
@@ -45,6 +44,44 @@ def post(path):
     return decorator
 
 
+def bare(func):
+    """Define decorator @bare for the routes skipping the auth and data middlewares"""
+    func.__bare__ = True
+    return func
+
+
+def cache_page(ttl):
+    """Define decorator @cache_page(ttl): cache the page rendered for the anonymous visitors for ttl seconds"""
+
+    def decorator(func):
+        func.__page_ttl__ = ttl
+        return func
+
+    return decorator
+
+
+# paths (or prefixes ending with '/') of the routes skipping the auth and data middlewares
+_bare_paths = set()
+_bare_prefixes = set()
+
+
+def add_bare_route(path):
+    """Let the requests of the path skip the auth and data middlewares, a path ending with '/' is a prefix"""
+    if path.endswith('/'):
+        _bare_prefixes.add(path)
+    else:
+        _bare_paths.add(path)
+
+
+def is_bare_route(path):
+    if path in _bare_paths:
+        return True
+    for prefix in _bare_prefixes:
+        if path.startswith(prefix):
+            return True
+    return False
+
+
 def get_kw_args(fn):
     named_args, required_args = [], []
     params = inspect.signature(fn).parameters
@@ -83,6 +120,38 @@ def has_request_arg(fn):
     return found
 
 
+# max size in bytes of the POST bodies parsed into the handler arguments
+MAX_BODY_SIZE = 1024 * 1024
+
+
+def check_body_size(request):
+    if request.content_length is not None and request.content_length > MAX_BODY_SIZE:
+        raise web.HTTPRequestEntityTooLarge(max_size=MAX_BODY_SIZE, actual_size=request.content_length)
+
+
+async def get_request_data(request):
+    """Parse the body of the POST request into a dict, only once for all the middlewares and the handler"""
+    data = getattr(request, '__data__', None)
+    if data is not None:
+        return data
+    if not request.content_type:
+        raise web.HTTPBadRequest(reason='Missing Content-Type.')
+    check_body_size(request)
+    ct = request.content_type.lower()
+    if ct.startswith('application/json'):
+        data = await request.json()
+        if not isinstance(data, dict):
+            raise web.HTTPBadRequest(reason='JSON body must be object.')
+    elif ct.startswith('application/x-www-form-urlencoded') or ct.startswith('multipart/form-data'):
+        params = await request.post()
+        data = dict(**params)
+    else:
+        raise web.HTTPBadRequest(reason='Unsupported Content-Type: %s' % request.content_type)
+    logging.debug('request data: %s' % str(data))
+    request.__data__ = data
+    return data
+
+
 class RequestHandler(object):
     def __init__(self, app, fn):
         self._app = app
@@ -91,53 +160,73 @@ class RequestHandler(object):
         self._has_var_kw_arg = has_var_kw_arg(fn)
         self._has_named_kw_args = has_named_kw_args(fn)
         self._named_kw_args, self._required_kw_args = get_kw_args(fn)
+        self.page_ttl = getattr(fn, '__page_ttl__', None)
+        # compile the argument binder of the route once, from the handler signature:
+        has_kw_args = self._has_var_kw_arg or self._has_named_kw_args or self._required_kw_args
+        route = getattr(fn, '__route__', None)
+        has_path_args = route is None or '{' in route
+        self._parse_body = bool(has_kw_args) and getattr(fn, '__method__', None) == 'POST'
+        if self._parse_body:
+            self._bind = self._bind_body
+        elif has_kw_args:
+            self._bind = self._bind_query
+        elif has_path_args:
+            self._bind = self._bind_path
+        elif self._has_request_arg:
+            self._bind = self._bind_request
+        else:
+            self._bind = self._bind_none
 
-    async def __call__(self, request):
-        kw = None
-        if self._has_var_kw_arg or self._has_named_kw_args or self._required_kw_args:
-            if request.method == 'POST':
-                if not request.content_type:
-                    return web.HTTPBadRequest('Missing Content-Type.')
-                ct = request.content_type.lower()
-                if ct.startswith('application/json'):
-                    params = await request.json()
-                    if not isinstance(params, dict):
-                        return web.HTTPBadRequest('JSON body must be object.')
-                    kw = params
-                elif ct.startswith('application/x-www-form-urlencoded') or ct.startswith('multipart/form-data'):
-                    params = await request.post()
-                    kw = dict(**params)
-                else:
-                    return web.HTTPBadRequest('Unsupported Content-Type: %s' % request.content_type)
-            if request.method == 'GET':
-                qs = request.query_string
-                if qs:
-                    kw = dict()
-                    for k, v in parse.parse_qs(qs, True).items():
-                        kw[k] = v[0]
-        if kw is None:
-            kw = dict(**request.match_info)
+    def _bind_none(self, request):
+        return {}
+
+    def _bind_request(self, request):
+        return {'request': request}
+
+    def _bind_path(self, request):
+        kw = dict(request.match_info)
+        if self._has_request_arg:
+            kw['request'] = request
+        return kw
+
+    def _bind_query(self, request):
+        query = request.query
+        if self._has_var_kw_arg:
+            kw = dict(query)
+        else:
+            kw = {name: query[name] for name in self._named_kw_args if name in query}
+        return self._bind_rest(request, kw)
+
+    def _bind_body(self, request, data):
+        if self._has_var_kw_arg:
+            kw = dict(data)
         else:
-            if not self._has_var_kw_arg and self._named_kw_args:
-                # remove all unnamed kw:
-                copy = dict()
-                for name in self._named_kw_args:
-                    if name in kw:
-                        copy[name] = kw[name]
-                kw = copy
-            # check named args:
-            for k, v in request.match_info.items():
-                if k in kw:
-                    logging.warning('Duplicate arg name in named arg and kw args: %s' % k)
-                kw[k] = v
+            kw = {name: data[name] for name in self._named_kw_args if name in data}
+        return self._bind_rest(request, kw)
+
+    def _bind_rest(self, request, kw):
+        # check named args:
+        for k, v in request.match_info.items():
+            if k in kw:
+                logging.warning('Duplicate arg name in named arg and kw args: %s' % k)
+            kw[k] = v
         if self._has_request_arg:
             kw['request'] = request
         # check required kw:
-        if self._required_kw_args:
-            for name in self._required_kw_args:
-                if not name in kw:
-                    return web.HTTPBadRequest('Missing argument: %s' % name)
-        logging.info('call with args: %s' % str(kw))
+        for name in self._required_kw_args:
+            if name not in kw:
+                raise web.HTTPBadRequest(reason='Missing argument: %s' % name)
+        return kw
+
+    async def __call__(self, request):
+        try:
+            if self._parse_body:
+                kw = self._bind(request, await get_request_data(request))
+            else:
+                kw = self._bind(request)
+        except web.HTTPException as e:
+            return e
+        logging.debug('call with args: %s', kw)
         try:
             r = await self._func(**kw)
             return r
@@ -145,10 +234,13 @@ class RequestHandler(object):
             return dict(error=e.error, data=e.data, message=e.message)
 
 
+STATIC_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+
+
 def add_static(app):
-    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
-    app.router.add_static('/static/', path)
-    logging.info('add static %s => %s' % ('/static/', path))
+    app.router.add_static('/static/', STATIC_ROOT)
+    add_bare_route('/static/')
+    logging.info('add static %s => %s' % ('/static/', STATIC_ROOT))
 
 
 def add_route(app, fn):
@@ -160,6 +252,8 @@ def add_route(app, fn):
         fn = asyncio.coroutine(fn)
     logging.info(
         'add route %s %s => %s(%s)' % (method, path, fn.__name__, ', '.join(inspect.signature(fn).parameters.keys())))
+    if getattr(fn, '__bare__', False):
+        add_bare_route(path)
     app.router.add_route(method, path, RequestHandler(app, fn))
 
 
@@ -7,16 +7,35 @@ __author__ = 'Nate_River'
 async web application: URL handlers
 '''
 
-import time, logging, hashlib, json, asyncio
+import os, time, logging, hashlib, asyncio
 import www.markdown2 as markdown
-from www.coreweb import get, post
-from www.models import User, Blog, Comment, next_id, Page, get_page_index
+from www.coreweb import get, post, bare, cache_page
+from www.models import User, Blog, Comment, next_id, Page, CursorPage, decode_cursor, get_page_index
 from conf.config import configs
 from www.apis import *
+from www.cache import LRUCache, page_cache
+from www.serializer import dumps
+from www.orm import table_version, pool_stats, query_cache_stats, explain_report, gather, count_rows, \
+    PoolTimeoutError
 from aiohttp import web
 
 COOKIE_NAME = 'DRAGON'
 _COOKIE_KEY = configs.session.secret
+# the comments of a page of /blog/{id} and /api/blogs/{id}/comments
+COMMENT_PAGE_SIZE = 20
+# distinguishes the table versions of this process from those of the other processes and of the restarts
+_PROCESS = '%s-%s' % (os.getpid(), time.time())
+# the pages of the listings found concurrently with their COUNT query, the deeper ones wait for the count
+CONCURRENT_PAGES = 10
+
+# markdown2 extras used to render the blog content
+_MARKDOWN_EXTRAS = ()
+# rendered html of the blog content: sha1(content + extras) ==> html
+_html_cache = LRUCache(maxsize=1024, maxbytes=32 * 1024 * 1024)
+# blog id ==> key of its rendered html in _html_cache
+_html_keys = dict()
+# user id ==> (user, version of the user table) of the session users, expiring long before the cookies
+_user_cache = LRUCache(maxsize=4096, ttl=600)
 
 
 def check_admin(request):
@@ -32,6 +51,18 @@ def user2cookie(user, max_age):
     return '-'.join(L)
 
 
+async def load_user(uid):
+    # Load the user by id, cached until any user is saved, updated (e.g. the password) or deleted
+    version = table_version(User.__table__)
+    cached = _user_cache.get(uid)
+    if cached is not None and cached[1] == version:
+        return User(**cached[0])
+    user = await User.find(uid)
+    if user:
+        _user_cache.put(uid, (dict(user), version))
+    return user
+
+
 async def cookie2user(cookie_str):
     # Parse cookie and load user if cookie is valid
     if not cookie_str:
@@ -43,7 +74,7 @@ async def cookie2user(cookie_str):
         uid, expires, sha1 = L
         if int(expires) < time.time():
             return None
-        user = await User.find(uid)
+        user = await load_user(uid)
         if not user:
             return None
         s = '%s-%s-%s-%s' % (user.id, user.password, expires, _COOKIE_KEY)
@@ -52,28 +83,59 @@ async def cookie2user(cookie_str):
             return None
         user.password = '********'
         return user
+    except (PoolTimeoutError, asyncio.CancelledError):
+        # answered 503 by response_factory, not as an anonymous user
+        raise
     except BaseException as e:
         logging.exception(e)
         return None
 
 
+def listing_version(table, *args):
+    # the __etag__ of a listing, read before its queries: changed by every write to the table through this process,
+    # None (the etag hashes the body) when the other processes write too
+    if not configs.etag.table_versions:
+        return None
+    return '%s-%s-%s' % (_PROCESS, table_version(table), '-'.join(map(str, args)))
+
+
 def text2html(text):
     lines = map(lambda s: '<p>%s</p>' % s.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;'),
                 filter(lambda s: s.strip() != '', text.split('\n')))
     return ''.join(lines)
 
 
+def render_markdown(content):
+    return markdown.markdown(content, extras=list(_MARKDOWN_EXTRAS))
+
+
+def markdown2html(blog):
+    # Render the blog content by markdown, reusing the html rendered from the same content before
+    key = hashlib.sha1(('%s\n%s' % (','.join(_MARKDOWN_EXTRAS), blog.content)).encode('utf-8')).hexdigest()
+    html = _html_cache.get(key)
+    if html is None:
+        html = render_markdown(blog.content)
+        _html_cache.put(key, html)
+    _html_keys[blog.id] = key
+    return html
+
+
+def invalidate_blog_html(blog_id):
+    # Drop the rendered html of the blog, called when the blog content changed
+    key = _html_keys.pop(blog_id, None)
+    if key is not None:
+        _html_cache.pop(key)
+
+
+@cache_page(ttl=60)
 @get(path='/')
 def index(*, page='1'):
     page_index = get_page_index(page)
-    num = yield from find_number(model='blog', selectField='id')
-    p = Page(num, page_index)
-    if num == 0:
-        blogs = []
-    else:
-        blogs = yield from find_models(model='blog', orderBy='created_at desc', limit=(p.offset, p.limit))
+    version = listing_version(Blog.__table__, page_index)
+    p, blogs = yield from find_number_and_page(model='blog', page_index=page_index, fields='listing')
     return {
         '__template__': 'blogs.html',
+        '__etag__': version,
         'page': p,
         'blogs': blogs
     }
@@ -102,20 +164,31 @@ def logout(request):
     return r
 
 
+@cache_page(ttl=120)
 @get(path='/blog/{id}')
 def get_blog(id):
-    blog = yield from find_model(model='blog', id=id)
-    comments = yield from find_models(model='comment', where='blog_id=?', args=[id], orderBy='created_at desc')
+    blog, p, comments = yield from find_blog_and_comments(id, page_size=COMMENT_PAGE_SIZE)
     for c in comments:
         c.html_content = text2html(c.content)
-    blog.html_content = markdown.markdown(blog.content)
+    if not blog.html_content:
+        # rows written before html_content existed and not backfilled yet
+        blog.html_content = markdown2html(blog)
+    version = '%s\n%s\n%s\n%s' % (blog.name, blog.content, ','.join(c.id for c in comments), p.next_cursor)
     return {
         '__template__': 'blog.html',
+        '__etag__': hashlib.sha1(version.encode('utf-8')).hexdigest(),
         'blog': blog,
+        'comment_page': p,
         'comments': comments
     }
 
 
+@bare
+@get(path='/health')
+def health():
+    return 'ok'
+
+
 @get(path='/manage/')
 def manage():
     return 'redirect:/manage/blogs'
@@ -188,7 +261,7 @@ def authenticate(*, email, password):
     r.set_cookie(name=COOKIE_NAME, value=user2cookie(user, 86400), max_age=86400, httponly=True)
     user.password = '********'
     r.content_type = 'application/json'
-    r.body = json.dumps(user, ensure_ascii=False).encode('utf-8')
+    r.body = dumps(user)
     return r
 
 
@@ -215,20 +288,21 @@ def register_check(*, email, password, name):
     r.set_cookie(name=COOKIE_NAME, value=user2cookie(user, 86400), max_age=86400, httponly=True)
     user.password = '********'
     r.content_type = 'application/json'
-    r.body = json.dumps(user, ensure_ascii=False).encode('utf-8')
+    r.body = dumps(user)
     return r
 
 
 @get(path='/api/blogs')
-def api_blogs(*, page='1'):
-    """loading blogs by page"""
+def api_blogs(*, page='1', cursor=None):
+    """loading blogs by page, or by the cursor returned as next_cursor of the previous page"""
+    if cursor is not None:
+        version = listing_version(Blog.__table__, 'cursor', cursor)
+        p, blogs = yield from find_page_after(model='blog', cursor=cursor, fields='listing')
+        return dict(page=p, blogs=blogs, __etag__=version)
     page_index = get_page_index(page)
-    num = yield from find_number(model='blog', selectField='id')
-    p = Page(num, page_index)
-    if num == 0:
-        return dict(page=p, blogs=[])
-    blogs = yield from find_models(model='blog', orderBy='created_at desc', limit=(p.offset, p.limit))
-    return dict(page=p, blogs=blogs)
+    version = listing_version(Blog.__table__, page_index)
+    p, blogs = yield from find_number_and_page(model='blog', page_index=page_index, fields='listing')
+    return dict(page=p, blogs=blogs, __etag__=version)
 
 
 @post(path='/api/blogs')
@@ -248,6 +322,7 @@ def api_edit_blog(request, *, id, name, summary, content):
     if id == '':
         blog = Blog(user_id=request.__user__.id, user_name=request.__user__.name, user_image=request.__user__.image,
                     name=name.strip(), summary=summary.strip(), content=content.strip())
+        blog.html_content = render_markdown(blog.content)
         yield from save_model(blog)
     # update the blog
     else:
@@ -255,7 +330,10 @@ def api_edit_blog(request, *, id, name, summary, content):
         blog.name = name
         blog.summary = summary
         blog.content = content
+        blog.html_content = render_markdown(blog.content)
         yield from update_model(blog)
+        invalidate_blog_html(blog.id)
+    page_cache.invalidate('/', '/blog/%s' % blog.id)
     return blog
 
 
@@ -270,34 +348,55 @@ def api_get_blog(*, id):
 def api_delete_blog(*, id):
     """delete a specify blog"""
     blog = yield from find_model(model='blog', id=id)
-    yield from delete_model(blog)
+    yield from delete_blog(blog)
+    invalidate_blog_html(blog.id)
+    page_cache.invalidate('/', '/blog/%s' % blog.id)
     return {}
 
 
+@get(path='/api/stats')
+def api_stats(request):
+    """the database connection pool and the cache statistics"""
+    check_admin(request)
+    return dict(pool=pool_stats(), query_cache=query_cache_stats(), page_cache=page_cache.stats(),
+                explain=explain_report())
+
+
 @get(path='/api/users')
-def api_get_users(*, page='1'):
-    """loading users by page"""
+def api_get_users(*, page='1', cursor=None):
+    """loading users by page, or by the cursor returned as next_cursor of the previous page"""
+    if cursor is not None:
+        version = listing_version(User.__table__, 'cursor', cursor)
+        p, users = yield from find_page_after(model='user', cursor=cursor, fields='listing')
+        return dict(page=p, users=users, __etag__=version)
     page_index = get_page_index(page)
-    num = yield from find_number(model='user', selectField='id')
-    p = Page(num, page_index)
-    if num == 0:
-        return dict(page=p, users=())
-    users = yield from find_models(model='user', orderBy='created_at desc', limit=(p.offset, p.limit))
-    for u in users:
-        u.password = '********'
-    return dict(page=p, users=users)
+    version = listing_version(User.__table__, page_index)
+    p, users = yield from find_number_and_page(model='user', page_index=page_index, fields='listing')
+    return dict(page=p, users=users, __etag__=version)
 
 
 @get(path='/api/comments')
-def api_get_comments(*, page='1'):
-    """loading comments by page"""
+def api_get_comments(*, page='1', cursor=None):
+    """loading comments by page, or by the cursor returned as next_cursor of the previous page"""
+    if cursor is not None:
+        version = listing_version(Comment.__table__, 'cursor', cursor)
+        p, comments = yield from find_page_after(model='comment', cursor=cursor)
+        return dict(page=p, comments=comments, __etag__=version)
     page_index = get_page_index(page)
-    num = yield from find_number(model='comment', selectField='id')
-    p = Page(num, page_index)
-    if num == 0:
-        return dict(page=p, users=())
-    comments = yield from find_models(model='comment', orderBy='created_at desc', limit=(p.offset, p.limit))
-    return dict(page=p, comments=comments)
+    version = listing_version(Comment.__table__, page_index)
+    p, comments = yield from find_number_and_page(model='comment', page_index=page_index)
+    return dict(page=p, comments=comments, __etag__=version)
+
+
+@get('/api/blogs/{id}/comments')
+def api_get_blog_comments(id, *, cursor=''):
+    """loading the comments of the blog by page, following the cursor returned as next_cursor of the previous page"""
+    version = listing_version(Comment.__table__, id, cursor)
+    p, comments = yield from find_page_after(model='comment', cursor=cursor, where='blog_id=?', args=[id],
+                                             page_size=COMMENT_PAGE_SIZE)
+    for c in comments:
+        c.html_content = text2html(c.content)
+    return dict(page=p, comments=comments, __etag__=version)
 
 
 @post('/api/blogs/{id}/comments')
@@ -314,6 +413,7 @@ def api_create_comment(id, request, *, content):
     comment = Comment(blog_id=blog.id, user_id=user.id, user_name=user.name, user_image=user.image,
                       content=content.strip())
     yield from save_model(comment)
+    page_cache.invalidate('/blog/%s' % blog.id)
     return comment
 
 
@@ -322,6 +422,7 @@ def api_delete_comment(*, id):
     """delete a specify comment"""
     comment = yield from find_model(model='comment', id=id)
     yield from delete_model(comment)
+    page_cache.invalidate('/blog/%s' % comment.blog_id)
     return {}
 
 
@@ -367,6 +468,71 @@ def find_models(model, where=None, args=None, **kw):
         return comments
 
 
+@asyncio.coroutine
+def find_page_after(model, cursor, where=None, args=None, page_size=10, fields=None):
+    """find the page after the cursor by keyset pagination, an empty cursor means the first page"""
+    after = None
+    if cursor:
+        after = decode_cursor(cursor)
+        if after is None:
+            raise APIValueError(field='cursor', message='Invalid cursor.')
+    models = yield from find_models(model=model, where=where, args=args, after=after, limit=page_size + 1,
+                                    fields=fields)
+    p = CursorPage(models, cursor=cursor, page_size=page_size)
+    return p, models[:page_size]
+
+
+@asyncio.coroutine
+def find_number_and_page(model, page_index, fields=None, page_size=10):
+    """count the models and find those of the page (by created_at desc)
+        the page is found concurrently with a COUNT query only within the first CONCURRENT_PAGES pages,
+        and cancelled as soon as the count shows it is empty
+    """
+    cls = dict(blog=Blog, user=User, comment=Comment)[model]
+    num = yield from count_rows(cls.__table__)
+    if num is None and page_index <= CONCURRENT_PAGES:
+
+        async def count():
+            num = await cls.findnumber(selectField='id')
+            if Page(num, page_index, page_size).limit == 0:
+                # cancels the page query through gather
+                raise EmptyPage(num)
+            return num
+
+        try:
+            num, models = yield from gather(count(), cls.findall(
+                orderBy='created_at desc', limit=(page_size * (page_index - 1), page_size), fields=fields))
+        except EmptyPage as e:
+            return Page(e.num, page_index, page_size), []
+        return Page(num, page_index, page_size), models
+    if num is None:
+        num = yield from cls.findnumber(selectField='id')
+    p = Page(num, page_index, page_size)
+    if p.limit == 0:
+        # no models, or the page index is out of range
+        return p, []
+    models = yield from cls.findall(orderBy='created_at desc', limit=(p.offset, p.limit), fields=fields)
+    return p, models
+
+
+class EmptyPage(Exception):
+    """The count of find_number_and_page shows the page is empty."""
+
+    def __init__(self, num):
+        super().__init__(num)
+        self.num = num
+
+
+@asyncio.coroutine
+def find_blog_and_comments(id, page_size=10):
+    """find the blog and the first page of its comments (keyset pagination) concurrently"""
+    blog, comments = yield from gather(
+        Blog.find(id),
+        Comment.findall(where='blog_id=?', args=[id], after=None, limit=page_size + 1))
+    p = CursorPage(comments, page_size=page_size)
+    return blog, p, comments[:page_size]
+
+
 @asyncio.coroutine
 def save_model(model):
     yield from model.save()
@@ -382,4 +548,9 @@ def delete_model(model):
     yield from model.delete()
 
 
+@asyncio.coroutine
+def delete_blog(blog):
+    yield from blog.delete_with_comments()
+
+
 """Patch for Incompatible versions"""
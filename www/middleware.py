@@ -7,9 +7,52 @@ __author__ = 'Nate_River'
 async web application: middleware
 '''
 
-import logging, json
+import logging, hashlib, mimetypes, os
 from aiohttp import web
+from multidict import CIMultiDict
+from www import serializer
+from www.orm import PoolTimeoutError, set_session
 from www.handlers import cookie2user, COOKIE_NAME
+from www.coreweb import is_bare_route, check_body_size
+from www.cache import page_cache
+from www.compress import MIN_SIZE, ENCODINGS, find_precompressed, choose_encoding, compress, is_compressible
+
+
+def make_etag(data):
+    return '"%s"' % hashlib.sha1(data).hexdigest()
+
+
+def etag_matches(request, etag):
+    """check the If-None-Match header of the request against the etag"""
+    if_none_match = request.headers.get('If-None-Match')
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        # the etags of the compressed bodies, see compress_factory
+        for coding, ext in ENCODINGS:
+            if tag.endswith('-%s"' % coding):
+                tag = tag[:-len(coding) - 2] + '"'
+        if tag == etag:
+            return True
+    return False
+
+
+def revalidated_coding(request, etag):
+    """the content coding of the representation whose etag the request revalidates, None for the identity"""
+    if_none_match = request.headers.get('If-None-Match', '')
+    for coding, ext in ENCODINGS:
+        if '%s-%s"' % (etag[:-1], coding) in if_none_match:
+            return coding
+    return None
+
+
+def not_modified(etag):
+    return web.Response(status=304, headers={'ETag': etag})
 
 
 async def logger_factory(app, handler):
@@ -20,30 +63,110 @@ async def logger_factory(app, handler):
     return logger
 
 
+async def compress_factory(app, handler):
+    async def compress_response(request):
+        if request.method == 'GET' and request.path.startswith('/static/'):
+            path, coding = find_precompressed(request)
+            if path is not None:
+                content_type = mimetypes.guess_type(os.path.splitext(path)[0])[0] or 'application/octet-stream'
+                return web.FileResponse(path, headers={
+                    'Content-Type': content_type, 'Content-Encoding': coding, 'Vary': 'Accept-Encoding'})
+        resp = await handler(request)
+        if resp.status == 304 and resp.headers.get('ETag'):
+            # of response_factory or page_cache_factory: the validator of the representation revalidated
+            etag = resp.headers['ETag']
+            coding = revalidated_coding(request, etag)
+            if coding is not None:
+                resp.headers['ETag'] = '%s-%s"' % (etag[:-1], coding)
+            resp.headers['Vary'] = 'Accept-Encoding'
+            return resp
+        if type(resp) is not web.Response or not isinstance(resp.body, bytes) or 'Content-Encoding' in resp.headers:
+            return resp
+        if len(resp.body) < MIN_SIZE or not is_compressible(resp.content_type):
+            return resp
+        resp.headers['Vary'] = 'Accept-Encoding'
+        coding, ext = choose_encoding(request)
+        if coding is None:
+            return resp
+        resp.body = compress(resp.body, coding)
+        resp.headers['Content-Encoding'] = coding
+        etag = resp.headers.get('ETag')
+        if etag:
+            # a compressed body is another representation, so another strong etag
+            resp.headers['ETag'] = '%s-%s"' % (etag[:-1], coding)
+        return resp
+
+    return compress_response
+
+
+async def page_cache_factory(app, handler):
+    async def cache_page(request):
+        ttl = getattr(request.match_info.handler, 'page_ttl', None)
+        if ttl is None or request.method != 'GET' or request.cookies.get(COOKIE_NAME):
+            return await handler(request)
+        rendered = []
+
+        async def render():
+            # the full page for the cache, whatever the conditional headers of the first visitor
+            headers = CIMultiDict(request.headers)
+            headers.popall('If-None-Match', None)
+            headers.popall('If-Modified-Since', None)
+            resp = await handler(request.clone(headers=headers))
+            rendered.append(resp)
+            # only the complete pages which are the same for every anonymous visitor
+            if type(resp) is web.Response and resp.status == 200 and 'Set-Cookie' not in resp.headers:
+                return resp.content_type, resp.charset, resp.headers.get('ETag'), resp.body
+            return None
+
+        page = await page_cache.get_or_render(request.path, request.query_string, ttl, render)
+        if page is None:
+            # not cacheable
+            return rendered[0] if rendered else await handler(request)
+        content_type, charset, etag, body = page
+        if etag is None:
+            return web.Response(body=body, content_type=content_type, charset=charset)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        return web.Response(body=body, content_type=content_type, charset=charset, headers={'ETag': etag})
+
+    return cache_page
+
+
 async def data_factory(app, handler):
     async def parse_data(request):
-        if request.method == 'POST':
-            if request.content_type.startswith('application/json'):
-                request.__data__ = await request.json()
-                logging.info('request json: %s' % str(request.__data__))
-            elif request.content_type.startswith('application/x-www-form-urlencoded'):
-                request.__data__ = await request.post()
-                logging.info('request form: %s' % str(request.__data__))
+        # the body is parsed lazily by get_request_data(), only reject the oversized ones early here
+        if request.method == 'POST' and not is_bare_route(request.path):
+            try:
+                check_body_size(request)
+            except web.HTTPException as e:
+                return e
         return await handler(request)
 
     return parse_data
 
 
+def service_unavailable(e, request):
+    # no free database connection in time: ask the client to retry rather than queue more requests
+    logging.warning('%s: %s %s' % (e, request.method, request.path))
+    return web.HTTPServiceUnavailable(headers={'Retry-After': '1'})
+
+
 async def auth_factory(app, handler):
     async def auth_user(request):
-        logging.info('check user: %s %s' % (request.method, request.path))
         request.__user__ = None
+        if is_bare_route(request.path):
+            return await handler(request)
+        logging.info('check user: %s %s' % (request.method, request.path))
         cookie_str = request.cookies.get(COOKIE_NAME)
         if cookie_str:
-            user = await cookie2user(cookie_str)
+            try:
+                user = await cookie2user(cookie_str)
+            except PoolTimeoutError as e:
+                return service_unavailable(e, request)
             if user:
                 logging.info('set current user: %s' % user.email)
                 request.__user__ = user
+                set_session(user.id)
         if request.path.startswith('/manage/') and (request.__user__ is None or not request.__user__.admin):
             return web.HTTPFound('/login')
         return await handler(request)
@@ -54,7 +177,10 @@ async def auth_factory(app, handler):
 async def response_factory(app, handler):
     async def response(request):
         logging.info('Response handler...')
-        r = await handler(request)
+        try:
+            r = await handler(request)
+        except PoolTimeoutError as e:
+            return service_unavailable(e, request)
         if isinstance(r, web.StreamResponse):
             return r
         if isinstance(r, bytes):
@@ -70,15 +196,26 @@ async def response_factory(app, handler):
         if isinstance(r, dict):
             template = r.get('__template__')
             r['__user__'] = request.__user__
+            # the version of the data given by the handler lets the 304 skip the rendering
+            version = r.pop('__etag__', None)
+            if version is not None:
+                uid = request.__user__.id if request.__user__ else ''
+                etag = make_etag(('%s-%s' % (version, uid)).encode('utf-8'))
+                if etag_matches(request, etag):
+                    return not_modified(etag)
             if template is None:
-                resp = web.Response(
-                    body=json.dumps(r, ensure_ascii=False, default=lambda o: o.__dict__).encode('utf-8'))
-                resp.content_type = 'application/json;charset=utf-8'
-                return resp
+                body = serializer.dumps(r)
+                content_type = 'application/json;charset=utf-8'
             else:
-                resp = web.Response(body=app['__templating__'].get_template(template).render(**r).encode('utf-8'))
-                resp.content_type = 'text/html;charset=utf-8'
-                return resp
+                body = app['__templating__'].get_template(template).render(**r).encode('utf-8')
+                content_type = 'text/html;charset=utf-8'
+            if version is None:
+                etag = make_etag(body)
+                if etag_matches(request, etag):
+                    return not_modified(etag)
+            resp = web.Response(body=body, headers={'ETag': etag})
+            resp.content_type = content_type
+            return resp
         if isinstance(r, int) and r >= 100 and r < 600:
             return web.Response(r)
         if isinstance(r, tuple) and len(r) == 2:
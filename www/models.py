@@ -9,7 +9,9 @@ async web models: user, blog and comment
 
 import time
 import uuid
-from www.orm import Model, StringField, BooleanField, FloatField, TextField
+import json
+import base64
+from www.orm import Model, StringField, BooleanField, FloatField, TextField, transaction
 
 
 def next_id():
@@ -18,6 +20,7 @@ def next_id():
 
 class User(Model):
     __table__ = 'user'
+    __projections__ = dict(listing=('id', 'email', 'admin', 'name', 'image', 'created_at'))
 
     id = StringField(primary_key=True, default=next_id, ddl='varchar(50)')
     email = StringField(ddl='varchar(50)')
@@ -30,6 +33,7 @@ class User(Model):
 
 class Blog(Model):
     __table__ = 'blog'
+    __projections__ = dict(listing=('id', 'user_id', 'user_name', 'user_image', 'name', 'summary', 'created_at'))
 
     id = StringField(primary_key=True, default=next_id, ddl='varchar(50)')
     user_id = StringField(ddl='varchar(50)')
@@ -38,8 +42,17 @@ class Blog(Model):
     name = StringField(ddl='varchar(50)')
     summary = StringField(ddl='varchar(200)')
     content = TextField()
+    html_content = TextField(default='')
     created_at = FloatField(default=time.time)
 
+    async def delete_with_comments(self):
+        """delete the blog and all its comments in a single transaction"""
+        async with transaction():
+            comments = await Comment.findall('`blog_id`=?', [self.id], fields=('id',))
+            if comments:
+                await Comment.delete_many(comments)
+            await self.delete()
+
 
 class Comment(Model):
     __table__ = 'comment'
@@ -76,6 +89,38 @@ class Page(object):
     __repr__ = __str__
 
 
+class CursorPage(object):
+    """Page of the keyset pagination: the items following the cursor by (created_at, id) desc"""
+
+    def __init__(self, items, cursor='', page_size=10):
+        """
+        :param items:   the items fetched after the cursor, at most page_size + 1 of them
+        """
+        self.page_size = page_size
+        self.cursor = cursor
+        self.has_next = len(items) > page_size
+        self.next_cursor = encode_cursor(items[page_size - 1]) if self.has_next else None
+
+    def __str__(self):
+        return 'cursor: %s, next_cursor: %s, page_size: %s' % (self.cursor, self.next_cursor, self.page_size)
+
+    __repr__ = __str__
+
+
+def encode_cursor(model):
+    s = json.dumps([model.created_at, model.id])
+    return base64.urlsafe_b64encode(s.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """return the (created_at, id) encoded in the cursor, None if the cursor is invalid"""
+    try:
+        created_at, id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        return float(created_at), str(id)
+    except (ValueError, TypeError):
+        return None
+
+
 def get_page_index(page):
     page_index = 1
     try:
@@ -8,40 +8,253 @@ orm framework.
 '''
 
 import logging
+import functools
+import time
+import contextlib
+import contextvars
 import aiomysql
 import asyncio
+import weakref
+import unicodedata
 from aiomysql import create_pool
+from www.cache import LRUCache
+
+
+class PoolTimeoutError(Exception):
+    """No connection of the pool became free within the acquire timeout."""
+    pass
+
+
+class PoolStats(object):
+    """gauges and acquire latency histogram of a connection pool"""
+    # upper bounds (seconds) of the buckets of the acquire latency histogram
+    BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+    def __init__(self, pool, name):
+        self.pool = pool
+        self.name = name
+        self.waiters = 0
+        self.timeouts = 0
+        self.acquired = 0
+        self.latency_sum = 0.0
+        self.latency_counts = [0] * (len(self.BUCKETS) + 1)
+
+    def observe(self, seconds):
+        self.acquired += 1
+        self.latency_sum += seconds
+        for i, bound in enumerate(self.BUCKETS):
+            if seconds <= bound:
+                self.latency_counts[i] += 1
+                return
+        self.latency_counts[-1] += 1
+
+    def load(self):
+        return self.waiters + self.pool.size - self.pool.freesize
+
+    def to_dict(self):
+        pool = self.pool
+        buckets = ['%s' % b for b in self.BUCKETS] + ['+Inf']
+        return dict(name=self.name, maxsize=pool.maxsize, minsize=pool.minsize, size=pool.size,
+                    free=pool.freesize, in_use=pool.size - pool.freesize, waiters=self.waiters,
+                    timeouts=self.timeouts, acquired=self.acquired, acquire_latency_sum=self.latency_sum,
+                    acquire_latency=dict(zip(buckets, self.latency_counts)))
+
+
+# the primary pool: all the writes and transactions, and the reads when there is no replica
+_primary = None
+# the replica pools: the reads outside transactions and read-your-writes windows
+_replicas = []
+_next_replica = 0
+# seconds to wait for a free connection before raising PoolTimeoutError, None means forever
+__acquire_timeout__ = None
+# seconds during which the reads of a session go to the primary after its own writes
+__ryw_window__ = 5
+# the key of the session of the current task, see set_session()
+_session = contextvars.ContextVar('session', default=None)
+# session key ==> True, expiring __ryw_window__ seconds after the last write of the session
+_session_writes = LRUCache(maxsize=10000)
 
 
 async def create_connection_pool(loop, **kwargs):
-    """create the connection pool"""
+    """create the primary connection pool and the pools of the replicas, and open their minsize connections
+        replicas: the configs of the read replicas, overriding the config of the primary
+    """
     logging.info('create database connection pool...')
-    global __pool__
-    __pool__ = await create_pool(
-        host=kwargs.get('host', 'localhost'),
-        port=kwargs.get('port', 3306),
-        user=kwargs['user'],
-        password=kwargs['password'],
-        db=kwargs['db'],
-        charset=kwargs.get('charset', 'utf8'),
-        autocommit=kwargs.get('autocommit', True),
-        maxsize=kwargs.get('maxsize', 10),
-        minsize=kwargs.get('minsize', 1),
+    global __pool__, _primary, _replicas, __acquire_timeout__, __ryw_window__
+    __pool__ = await create_pool_of(loop, kwargs)
+    # print(type(__pool__))   # <class 'aiomysql.pool.Pool'>
+    _primary = PoolStats(__pool__, '%s:%s' % (kwargs.get('host', 'localhost'), kwargs.get('port', 3306)))
+    _replicas = []
+    for replica in kwargs.get('replicas', None) or ():
+        config = dict(kwargs, **replica)
+        pool = await create_pool_of(loop, config)
+        _replicas.append(PoolStats(pool, '%s:%s' % (config.get('host', 'localhost'), config.get('port', 3306))))
+    __acquire_timeout__ = kwargs.get('acquire_timeout', None)
+    __ryw_window__ = kwargs.get('read_your_writes', __ryw_window__)
+    if kwargs.get('explain', False):
+        enable_explain()
+    for stats in [_primary] + _replicas:
+        await warm_up_pool(stats)
+
+
+async def create_pool_of(loop, config):
+    return await create_pool(
+        host=config.get('host', 'localhost'),
+        port=config.get('port', 3306),
+        user=config['user'],
+        password=config['password'],
+        db=config['db'],
+        charset=config.get('charset', 'utf8'),
+        autocommit=config.get('autocommit', True),
+        maxsize=config.get('maxsize', 10),
+        minsize=config.get('minsize', 1),
+        pool_recycle=config.get('pool_recycle', -1),
         loop=loop
     )
-    # print(type(__pool__))   # <class 'aiomysql.pool.Pool'>
 
 
-async def select(sql, args, size=None):
+async def warm_up_pool(stats):
+    """check the minsize connections opened by the pool, so the first requests do not pay for broken ones"""
+    pool = stats.pool
+    conns = []
+    try:
+        for i in range(pool.minsize):
+            conns.append(await pool.acquire())
+        for conn in conns:
+            await conn.ping()
+    finally:
+        for conn in conns:
+            pool.release(conn)
+    logging.info('database connection pool %s ready: %s connections' % (stats.name, pool.size))
+
+
+def pool_stats():
+    """return the gauges and the acquire latency histograms of the connection pools"""
+    return dict(primary=_primary.to_dict(), replicas=[r.to_dict() for r in _replicas])
+
+
+def set_session(key):
+    """set the session (e.g. the user id) of the current task, its reads follow its own writes"""
+    _session.set(key)
+
+
+def record_write():
+    if __ryw_window__ <= 0:
+        # read-your-writes disabled
+        return
+    key = _session.get()
+    if key is None:
+        # no session: the writes are followed by the reads of the current task only
+        key = object()
+        _session.set(key)
+    _session_writes.put(key, True, ttl=__ryw_window__)
+
+
+def following_writes():
+    """whether the current task wrote within the read-your-writes window"""
+    key = _session.get()
+    return key is not None and _session_writes.get(key) is not None
+
+
+def choose_pool(readonly):
+    """the primary, or the least loaded replica (round robin among the equally loaded ones) for reads"""
+    global _next_replica
+    if not readonly or not _replicas:
+        return _primary
+    if following_writes():
+        return _primary
+    _next_replica = (_next_replica + 1) % len(_replicas)
+    return min(_replicas[_next_replica:] + _replicas[:_next_replica], key=lambda r: r.load())
+
+
+@contextlib.asynccontextmanager
+async def acquire(readonly=False):
+    """acquire a connection of the pool chosen by choose_pool, raise PoolTimeoutError after the acquire timeout"""
+    stats = choose_pool(readonly)
+    start = time.monotonic()
+    stats.waiters += 1
+    try:
+        conn = await asyncio.wait_for(stats.pool.acquire(), __acquire_timeout__)
+    except asyncio.TimeoutError:
+        stats.timeouts += 1
+        raise PoolTimeoutError('no free database connection of %s in %ss' % (stats.name, __acquire_timeout__))
+    finally:
+        stats.waiters -= 1
+    stats.observe(time.monotonic() - start)
+    try:
+        yield conn
+    finally:
+        stats.pool.release(conn)
+
+
+@functools.lru_cache(maxsize=1024)
+def translate(sql):
+    """translate the '?' placeholders to the '%s' placeholders of MySQL"""
+    return sql.replace('?', '%s')
+
+
+class Transaction(object):
+    def __init__(self, conn):
+        self.conn = conn
+        # the tables written in the transaction, invalidated again when it ends
+        self.tables = set()
+        # table name ==> rows inserted - rows deleted, applied to the row counters on commit
+        self.row_deltas = dict()
+
+
+# the transaction of the current task, see transaction()
+_transaction = contextvars.ContextVar('transaction', default=None)
+
+
+@contextlib.asynccontextmanager
+async def transaction():
+    """async with transaction() as tx: ...
+        select, execute and the Model methods in the block share one connection, committed at the end of the
+        block or rolled back on exception. a nested block joins the outer transaction.
+    """
+    tx = _transaction.get()
+    if tx is not None:
+        yield tx
+        return
+    async with acquire() as conn:
+        await conn.begin()
+        tx = Transaction(conn)
+        token = _transaction.set(tx)
+        try:
+            yield tx
+            await conn.commit()
+            for table, delta in tx.row_deltas.items():
+                adjust_memory_counter(table, delta)
+        except BaseException:
+            await conn.rollback()
+            raise
+        finally:
+            _transaction.reset(token)
+            for table in tx.tables:
+                invalidate_table(table)
+
+
+@contextlib.asynccontextmanager
+async def connection(readonly=False):
+    """the connection of the current transaction, or one acquired from the pools"""
+    tx = _transaction.get()
+    if tx is not None:
+        yield tx.conn
+        return
+    async with acquire(readonly) as conn:
+        yield conn
+
+
+async def select(sql, args, size=None, readonly=True):
     """execute select instruction
         return the query result set
+        readonly: False to read from the primary, not from a replica
     """
     logging.info('SQL: %s', sql)
-    global __pool__
-    async with __pool__.get() as conn:
+    async with connection(readonly=readonly) as conn:
         # print(type(conn))   # <class 'aiomysql.connection.Connection'>
         async with conn.cursor(aiomysql.DictCursor) as cursor:
-            await cursor.execute(sql.replace('?', '%s'), args or ())
+            await cursor.execute(translate(sql), args or ())
             if size:
                 if size == 1:
                     rs = await cursor.fetchone()
@@ -49,8 +262,323 @@ async def select(sql, args, size=None):
                     rs = await cursor.fetchmany(size)
             else:
                 rs = await cursor.fetchall()
-            logging.info('result set size: %s' % len(rs))
+            logging.info('result set size: %s' % (len(rs) if size != 1 else int(rs is not None)))
+            if __explained__ is not None and sql not in __explained__:
+                __explained__[sql] = []
+                __explained__[sql] = await explain(cursor, sql, args)
+            return rs
+
+
+# query shape (the sql of select) ==> the problems found by its EXPLAIN, None until enable_explain() is called
+__explained__ = None
+
+
+def enable_explain():
+    """EXPLAIN once every distinct query shape issued through select, warning of the full scans and filesorts"""
+    logging.info('enable EXPLAIN of the query shapes')
+    global __explained__
+    __explained__ = dict()
+
+
+def explain_report():
+    """return the query shapes explained so far that have problems ==> their problems"""
+    return {sql: problems for sql, problems in (__explained__ or {}).items() if problems}
+
+
+async def explain(cursor, sql, args):
+    """return the problems of the plan of the query: full table scans and filesorts"""
+    try:
+        await cursor.execute('EXPLAIN ' + translate(sql), args or ())
+        plan = await cursor.fetchall()
+    except Exception as e:
+        logging.warning('EXPLAIN failed: %s: %s' % (sql, e))
+        return []
+    problems = []
+    for row in plan:
+        if row.get('type') == 'ALL':
+            problems.append('full scan of %s' % row.get('table'))
+        if 'Using filesort' in (row.get('Extra') or ''):
+            problems.append('filesort of %s' % row.get('table'))
+    if problems:
+        logging.warning('EXPLAIN %s: %s' % (sql, ', '.join(problems)))
+    return problems
+
+
+async def iterate_select(sql, args, batch_size=100):
+    """execute select instruction with a server-side cursor
+        yield the result set in lists of at most batch_size rows, never holding the whole result set in memory
+    """
+    logging.info('SQL: %s', sql)
+    async with connection(readonly=True) as conn:
+        async with conn.cursor(aiomysql.SSDictCursor) as cursor:
+            await cursor.execute(translate(sql), args or ())
+            while True:
+                rs = await cursor.fetchmany(batch_size)
+                if not rs:
+                    break
+                yield rs
+
+
+async def gather(*aws, limit=None):
+    """run the queries concurrently, return their results in order
+        limit: at most this number of queries at once, by default the connections left in the pool of the reads
+        the first error cancels the queries left; in a transaction they run one by one on its connection
+    """
+    if _transaction.get() is not None:
+        aws = list(aws)
+        results = []
+        try:
+            for aw in aws:
+                results.append(await aw)
+        finally:
+            # the coroutines never started after an error
+            for aw in aws[len(results) + 1:]:
+                aw.close()
+        return results
+    if limit is None:
+        stats = choose_pool(readonly=True)
+        limit = len(aws) if stats is None else stats.pool.maxsize - stats.load()
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(aw):
+        async with semaphore:
+            return await aw
+
+    tasks = [asyncio.ensure_future(run(aw)) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+# result cache of the model queries, None until enable_query_cache() is called
+__query_cache__ = None
+# table name ==> version, bumped by every write to the table
+_table_versions = dict()
+# table name ==> time.monotonic() of the last write to the table
+_table_writes = dict()
+_missing = object()
+
+
+def enable_query_cache(maxsize=1024, ttl=60):
+    """cache the result sets of Model.find, findall and findnumber"""
+    logging.info('enable query cache: maxsize=%s, ttl=%s' % (maxsize, ttl))
+    global __query_cache__
+    __query_cache__ = LRUCache(maxsize=maxsize, ttl=ttl)
+
+
+def query_cache_stats():
+    """return the hit/miss counters of the query cache"""
+    if __query_cache__ is None:
+        return None
+    return __query_cache__.stats()
+
+
+def table_version(table):
+    return _table_versions.get(table, 0)
+
+
+def invalidate_table(table):
+    """make every cached result of the table stale"""
+    _table_versions[table] = table_version(table) + 1
+    _table_writes[table] = time.monotonic()
+    tx = _transaction.get()
+    if tx is not None:
+        tx.tables.add(table)
+
+
+async def cached_select(table, sql, args, size=None, loader=None):
+    """execute select instruction through the query cache (if enabled)
+        loader: coroutine function loading the result set instead (e.g. a batched find)
+    """
+    if not can_share():
+        # never share the uncommitted rows of a transaction, nor stale rows with the task that wrote them
+        return await select(sql, args, size)
+    if _replicas and recently_written(table):
+        # the replicas may lag behind the last write: read (and cache) the rows of the primary
+        loader = functools.partial(select, sql, args, size, readonly=False)
+    elif loader is None:
+        loader = functools.partial(shared_select, table, sql, args, size)
+    if __query_cache__ is None:
+        return await loader()
+    # the table version in the key drops the results cached before the last write
+    key = (table, table_version(table), sql, tuple(args or ()), size)
+    rs = __query_cache__.get(key, _missing)
+    if rs is _missing:
+        rs = await loader()
+        __query_cache__.put(key, rs)
+    return rs
+
+
+def recently_written(table):
+    """whether the table was written within the read-your-writes window"""
+    return time.monotonic() - _table_writes.get(table, float('-inf')) < __ryw_window__
+
+
+def can_share():
+    """whether the current task may share the reads of the other tasks"""
+    return _transaction.get() is None and not following_writes()
+
+
+# event loop ==> {(table, table version, sql, args, size): future of the select in flight}
+_inflight_selects = weakref.WeakKeyDictionary()
+
+
+async def shared_select(table, sql, args, size=None):
+    """execute select instruction, or wait for the result set of the identical select in flight (single-flight)
+        table: the table read, the selects started before its last write are not shared
+    """
+    loop = asyncio.get_running_loop()
+    inflight = _inflight_selects.setdefault(loop, dict())
+    key = (table, table_version(table), sql, tuple(args or ()), size)
+    future = inflight.get(key)
+    if future is not None:
+        rs = await asyncio.shield(future)
+        if rs is not _missing:
             return rs
+        # the select in flight failed or was cancelled: run our own
+        return await select(sql, args, size)
+    future = inflight[key] = loop.create_future()
+    rs = _missing
+    try:
+        rs = await select(sql, args, size)
+        return rs
+    finally:
+        del inflight[key]
+        future.set_result(rs)
+
+
+# the batches of Model.find: at most this number of primary keys per query
+FIND_BATCH_SIZE = 100
+# event loop ==> {model class: {primary key: future of the row}} of the batches to load
+_find_batches = weakref.WeakKeyDictionary()
+_loading_batches = set()
+
+
+async def batch_find(cls, pk):
+    """load the row of the primary key with those of the concurrent finds of the model, in one query"""
+    loop = asyncio.get_running_loop()
+    batches = _find_batches.setdefault(loop, dict())
+    batch = batches.get(cls)
+    if batch is None or len(batch) >= FIND_BATCH_SIZE:
+        batch = batches[cls] = dict()
+        # the finds of the current loop iteration join the batch before it is loaded
+        loop.call_soon(start_batch, loop, cls, batch)
+    future = batch.get(pk)
+    if future is None:
+        future = batch[pk] = loop.create_future()
+    return await asyncio.shield(future)
+
+
+def start_batch(loop, cls, batch):
+    batches = _find_batches.get(loop)
+    if batches is not None and batches.get(cls) is batch:
+        del batches[cls]
+    task = loop.create_task(load_batch(cls, batch))
+    _loading_batches.add(task)
+    task.add_done_callback(_loading_batches.discard)
+
+
+async def load_batch(cls, batch):
+    pks = list(batch)
+    if len(pks) == 1:
+        sql, args = cls.__find__, pks
+    else:
+        sql = compile_select(cls.__select__, '`%s` in (%s)' % (cls.__primarykey__, create_args_string(len(pks))))
+        args = pks
+    try:
+        rs = await shared_select(cls.__table__, sql, args)
+    except BaseException as e:
+        for future in batch.values():
+            future.set_exception(e if isinstance(e, Exception) else RuntimeError('batch of %s cancelled' % cls.__name__))
+            # the waiters may be gone already, do not log the error once more
+            future.exception()
+        if not isinstance(e, Exception):
+            raise
+        return
+    logging.info('batch find of %s: %s rows, %s keys' % (cls.__name__, len(rs), len(pks)))
+    if len(pks) == 1:
+        # whatever the collation matched
+        for future in batch.values():
+            future.set_result(rs[0] if rs else None)
+        return
+    rows = {collation_key(r[cls.__primarykey__]): r for r in rs}
+    for pk, future in batch.items():
+        future.set_result(rows.get(collation_key(pk)))
+
+
+def collation_key(value):
+    # the strings equal for the case-insensitive, space-padded utf8_general_ci collation of the tables
+    if isinstance(value, str):
+        return ''.join(c for c in unicodedata.normalize('NFKD', value.rstrip(' '))
+                       if not unicodedata.combining(c)).casefold()
+    return value
+
+
+# the counters of the rows of the tables: None (count by queries), 'memory' or 'table'
+__counter_backend__ = None
+# table name ==> number of rows, maintained by Model.save and Model.delete (backend 'memory')
+_row_counters = dict()
+
+
+async def enable_row_counters(*models, backend='memory'):
+    """count the rows of the models by counters seeded here instead of COUNT queries
+        backend 'memory':   in-process counters, only right if this process is the only writer
+        backend 'table':    counters stored in the `row_counter` table, shared by all processes
+    """
+    if backend not in ('memory', 'table'):
+        raise ValueError('Invalid row counter backend: %s' % backend)
+    logging.info('enable row counters: %s' % backend)
+    global __counter_backend__
+    for model in models:
+        table = model.__table__
+        if backend == 'memory':
+            # seeded once and never again: count on the primary, not on a replica lagging behind
+            rs = await select('select count(*) _num_ from `%s`' % table, None, 1, readonly=False)
+            _row_counters[table] = rs['_num_']
+        else:
+            # keep the counter if another process has seeded it already
+            await execute('insert ignore into `row_counter` (`table_name`, `num`) select ?, count(*) from `%s`' % table,
+                          [table])
+    __counter_backend__ = backend
+
+
+async def count_rows(table):
+    """return the counted number of rows of the table, None if the table is not counted"""
+    if __counter_backend__ == 'memory':
+        return _row_counters.get(table, None)
+    if __counter_backend__ == 'table':
+        rs = await cached_select(table, 'select `num` from `row_counter` where `table_name`=?', [table], 1)
+        return rs['num'] if rs else None
+    return None
+
+
+def adjust_memory_counter(table, delta):
+    if table in _row_counters:
+        _row_counters[table] += delta
+
+
+async def adjust_row_counter(table, delta):
+    if __counter_backend__ == 'memory':
+        tx = _transaction.get()
+        if tx is not None:
+            tx.row_deltas[table] = tx.row_deltas.get(table, 0) + delta
+        else:
+            adjust_memory_counter(table, delta)
+    elif __counter_backend__ == 'table':
+        await execute('update `row_counter` set `num`=`num`+? where `table_name`=?', [delta, table])
+
+
+@contextlib.asynccontextmanager
+async def counted_write():
+    """the transaction of a write and the update of its row counter in the `row_counter` table"""
+    if __counter_backend__ == 'table':
+        async with transaction():
+            yield
+    else:
+        yield
 
 
 async def execute(sql, args, autocommit=True):
@@ -58,13 +586,16 @@ async def execute(sql, args, autocommit=True):
         return the affected rows number
     """
     logging.info('SQL: %s', sql)
-    global __pool__
-    async with __pool__.get() as conn:
+    record_write()
+    if _transaction.get() is not None:
+        # committed with the transaction
+        autocommit = True
+    async with connection() as conn:
         if not autocommit:
             await conn.begin()
         try:
             async with conn.cursor(aiomysql.DictCursor) as cursor:
-                await cursor.execute(sql.replace('?', '%s'), args)
+                await cursor.execute(translate(sql), args)
                 affected = cursor.rowcount
             if not autocommit:
                 await conn.commit()
@@ -75,6 +606,25 @@ async def execute(sql, args, autocommit=True):
         return affected
 
 
+async def execute_batch(statements):
+    """execute the (sql, args) statements in a single transaction on one connection
+        return the total affected rows number
+    """
+    affected = 0
+    record_write()
+    async with transaction() as tx:
+        async with tx.conn.cursor() as cursor:
+            for sql, args in statements:
+                await cursor.execute(translate(sql), args)
+                affected += cursor.rowcount
+    return affected
+
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
 class Field(object):
     def __init__(self, name, column_type, primary_key, default):
         self.name = name
@@ -116,6 +666,30 @@ def create_args_string(num):
     return s[:len(s) - 2]
 
 
+@functools.lru_cache(maxsize=512)
+def compile_select(select, where=None, orderby=None, limit=0):
+    """build the SELECT statement once for every query shape
+        limit: the number of placeholders in the limit clause (0, 1 or 2)
+    """
+    sql = [select]
+    if where:
+        sql.append('where')
+        sql.append(where)
+    if orderby:
+        sql.append('order by')
+        sql.append(orderby)
+    if limit:
+        sql.append('limit')
+        sql.append(create_args_string(limit))
+    return ' '.join(sql)
+
+
+@functools.lru_cache(maxsize=128)
+def compile_projection(table, fields):
+    """build the SELECT clause of the subset of fields (a tuple) of the table"""
+    return 'select %s from `%s`' % (', '.join(map(lambda f: '`%s`' % f, fields)), table)
+
+
 class ModelMetaclass(type):
     """Metaclass of the class Model"""
 
@@ -167,10 +741,27 @@ class ModelMetaclass(type):
         attrs['__update__'] = 'update `%s` set %s where `%s`=?' % (
             tablename, ', '.join(map(lambda f: '`%s`=?' % (mappings.get(f).name or f), fields)), primary_key)
         attrs['__delete__'] = 'delete from `%s` where `%s`=?' % (tablename, primary_key)
+        attrs['__find__'] = '%s where `%s`=?' % (attrs['__select__'], primary_key)
+        # the SELECT clauses of the named projections, e.g. the listings leaving the long texts out
+        selects = dict()
+        for pname, pfields in (attrs.get('__projections__', None) or dict()).items():
+            for f in pfields:
+                if f not in mappings:
+                    raise RuntimeError('Field %s of projection %s not found.' % (f, pname))
+            selects[pname] = compile_projection(tablename, tuple(pfields))
+        attrs['__selects__'] = selects
+        # keyset pagination on (created_at, primary key): the rows after the given ones in descending order
+        attrs['__seek__'] = attrs['__seekorder__'] = None
+        if 'created_at' in mappings:
+            attrs['__seek__'] = '(`created_at`<? or (`created_at`=? and `%s`<?))' % primary_key
+            attrs['__seekorder__'] = '`created_at` desc, `%s` desc' % primary_key
         return type.__new__(cls, name, bases, attrs)
 
 
 class Model(dict, metaclass=ModelMetaclass):
+    # name ==> fields of the subsets of the model loaded by find/findall(fields=name), e.g. for the listings
+    __projections__ = dict()
+
     def __init__(self, **kwargs):
         super(Model, self).__init__(**kwargs)
 
@@ -195,67 +786,183 @@ class Model(dict, metaclass=ModelMetaclass):
         return value
 
     @classmethod
-    async def find(cls, pk):
-        """find object by primary key value"""
-        rs = await select('%s where `%s`=?' % (cls.__select__, cls.__primarykey__), args=(pk,), size=1)
-        if len(rs) == 0:
+    def selectclause(cls, fields=None):
+        """the SELECT clause of all the fields, of a named projection or of a tuple of fields"""
+        if fields is None:
+            return cls.__select__
+        if isinstance(fields, str):
+            return cls.__selects__[fields]
+        for f in fields:
+            if f not in cls.__mappings__:
+                raise ValueError('Invalid field: %s' % f)
+        return compile_projection(cls.__table__, tuple(fields))
+
+    @classmethod
+    async def find(cls, pk, fields=None):
+        """find object by primary key value
+            fields: only load these fields (see selectclause), the object is partial then
+        """
+        if fields is None:
+            sql = cls.__find__
+            # the concurrent finds of the model are coalesced into one query
+            loader = functools.partial(batch_find, cls, pk)
+        else:
+            sql = compile_select(cls.selectclause(fields), '`%s`=?' % cls.__primarykey__)
+            loader = None
+        rs = await cached_select(cls.__table__, sql, args=(pk,), size=1, loader=loader)
+        if not rs:
             return None
         return cls(**rs)
 
     @classmethod
     async def findall(cls, where=None, args=None, **kw):
-        """find objects by where clause and else ..."""
-        sql = [cls.__select__]
-        if where:
-            sql.append('where')
-            sql.append(where)
-        if args is None:
-            args = []
+        """find objects by where clause and else ...
+            after: switch to the keyset pagination, ordered by (created_at, pk) desc:
+                   (created_at, pk) of the last object of the previous page, None for the first page
+            fields: only load these fields (see selectclause), the objects are partial then
+        """
+        args = list(args) if args else []
         orderby = kw.get('orderBy', None)
-        if orderby:
-            sql.append('order by')
-            sql.append(orderby)
+        if 'after' in kw:
+            if cls.__seek__ is None:
+                raise ValueError('Keyset pagination needs a created_at field: %s' % cls.__name__)
+            after = kw['after']
+            if after is not None:
+                where = '(%s) and %s' % (where, cls.__seek__) if where else cls.__seek__
+                args.extend((after[0], after[0], after[1]))
+            orderby = cls.__seekorder__
         limit = kw.get('limit', None)
-        if limit is not None:
-            sql.append('limit')
-            if isinstance(limit, int):
-                sql.append('?')
-                args.append(limit)
-            elif isinstance(limit, tuple) and len(limit) == 2:
-                sql.append('?, ?')
-                args.extend(limit)
-            else:
-                raise ValueError('Invalid limit value: %s' % str(limit))
-        rs = await select(' '.join(sql), args)
+        if limit is None:
+            shape = 0
+        elif isinstance(limit, int):
+            shape = 1
+            args.append(limit)
+        elif isinstance(limit, tuple) and len(limit) == 2:
+            shape = 2
+            args.extend(limit)
+        else:
+            raise ValueError('Invalid limit value: %s' % str(limit))
+        sql = compile_select(cls.selectclause(kw.get('fields', None)), where, orderby, shape)
+        rs = await cached_select(cls.__table__, sql, args)
         return [cls(**r) for r in rs]
 
+    @classmethod
+    async def iterate(cls, where=None, args=None, batch_size=100, **kw):
+        """iterate over the objects found by where clause in lists of at most batch_size objects,
+            for the exports and backfills over large tables. kw: orderBy, fields
+        """
+        sql = compile_select(cls.selectclause(kw.get('fields', None)), where, kw.get('orderBy', None))
+        async for rs in iterate_select(sql, args, batch_size):
+            yield [cls(**r) for r in rs]
+
     @classmethod
     async def findnumber(cls, selectField, where=None, args=None):
-        sql = ['select count(%s) _num_ from `%s`' % (selectField, cls.__table__)]
-        if where:
-            sql.append('where')
-            sql.append(where)
-        rs = await select(' '.join(sql), args, 1)
-        if len(rs) == 0:
+        if where is None and selectField == cls.__primarykey__:
+            num = await count_rows(cls.__table__)
+            if num is not None:
+                return num
+        sql = compile_select('select count(%s) _num_ from `%s`' % (selectField, cls.__table__), where)
+        rs = await cached_select(cls.__table__, sql, args, 1)
+        if not rs:
             return None
         return rs['_num_']
 
+    @classmethod
+    async def save_many(cls, objects, chunk_size=500):
+        """insert the objects by multi-row INSERT statements of chunk_size rows, all in a single transaction"""
+        objects = list(objects)
+        start = time.time()
+
+        def statements():
+            for chunk in chunks(objects, chunk_size):
+                args = []
+                for obj in chunk:
+                    args.extend(map(obj.getvalue, cls.__fields__))
+                    args.append(obj.getvalue(cls.__primarykey__))
+                values = ', (%s)' % create_args_string(len(cls.__fields__) + 1)
+                yield cls.__insert__ + values * (len(chunk) - 1), args
+
+        async with counted_write():
+            rows = await execute_batch(statements())
+            await adjust_row_counter(cls.__table__, rows)
+        cls._bulk_done('insert', rows, len(objects), start)
+        return rows
+
+    @classmethod
+    async def update_many(cls, objects):
+        """update the objects by primary key, all in a single transaction"""
+        objects = list(objects)
+        start = time.time()
+        for obj in objects:
+            missing = [f for f in cls.__fields__ if f not in obj]
+            if missing:
+                raise ValueError('Cannot update the missing fields: %s' % ', '.join(missing))
+
+        def statements():
+            for obj in objects:
+                args = list(map(lambda key: getattr(obj, key, None), cls.__fields__))
+                args.append(getattr(obj, cls.__primarykey__, None))
+                yield cls.__update__, args
+
+        rows = await execute_batch(statements())
+        cls._bulk_done('update', rows, len(objects), start)
+        return rows
+
+    @classmethod
+    async def delete_many(cls, objects, chunk_size=500):
+        """delete the objects by primary key, chunk_size of them per statement, all in a single transaction"""
+        pks = [getattr(obj, cls.__primarykey__, None) for obj in objects]
+        start = time.time()
+
+        def statements():
+            for chunk in chunks(pks, chunk_size):
+                yield 'delete from `%s` where `%s` in (%s)' % (
+                    cls.__table__, cls.__primarykey__, create_args_string(len(chunk))), chunk
+
+        async with counted_write():
+            rows = await execute_batch(statements())
+            await adjust_row_counter(cls.__table__, -rows)
+        cls._bulk_done('delete', rows, len(pks), start)
+        return rows
+
+    @classmethod
+    def _bulk_done(cls, action, rows, total, start):
+        invalidate_table(cls.__table__)
+        elapsed = time.time() - start
+        logging.info('bulk %s on `%s`: %s objects, %s affected rows in %.3fs (%.0f rows/s)' % (
+            action, cls.__table__, total, rows, elapsed, rows / elapsed if elapsed > 0 else 0))
+        if rows != total:
+            logging.warning('bulk %s by primary key: %s objects, affected rows: %s' % (action, total, rows))
+
     async def save(self):
         args = list(map(self.getvalue, self.__fields__))
         args.append(self.getvalue(self.__primarykey__))
-        rows = await execute(self.__insert__, args=args)
+        async with counted_write():
+            rows = await execute(self.__insert__, args=args)
+            if rows == 1:
+                await adjust_row_counter(self.__table__, 1)
+        invalidate_table(self.__table__)
         if rows != 1:
             logging.warning('failed to insert by primary key: affected rows: %s' % rows)
 
     async def update(self):
+        missing = [f for f in self.__fields__ if f not in self]
+        if missing:
+            # a partial object loaded with fields would overwrite the missing fields with null
+            raise ValueError('Cannot update the missing fields: %s' % ', '.join(missing))
         args = list(map(lambda key: getattr(self, key, None), self.__fields__))
         args.append(getattr(self, self.__primarykey__, None))
         rows = await execute(self.__update__, args=args)
+        invalidate_table(self.__table__)
         if rows != 1:
             logging.warning('failed to update by primary key: affected rows: %s' % rows)
 
     async def delete(self):
         args = [getattr(self, self.__primarykey__, None)]
-        rows = await execute(self.__delete__, args=args)
+        async with counted_write():
+            rows = await execute(self.__delete__, args=args)
+            if rows == 1:
+                await adjust_row_counter(self.__table__, -1)
+        invalidate_table(self.__table__)
         if rows != 1:
             logging.warning('failed to delete by primary key: affected rows: %s' % rows)
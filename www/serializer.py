@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = 'Nate_River'
+
+'''
+JSON serialization of the responses: orjson or ujson when installed, else the json module.
+'''
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def default(o):
+    # Page, CursorPage and the other plain objects
+    return o.__dict__
+
+
+def dumps(obj):
+    """serialize obj to UTF-8 encoded JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=default)
+    if ujson is not None:
+        return ujson.dumps(obj, ensure_ascii=False, default=default).encode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, default=default).encode('utf-8')
+
@@ -10,9 +10,10 @@ async web application.
 import asyncio, os, time, logging
 from datetime import datetime
 from aiohttp import web
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
 from conf.config import configs
-from www.orm import create_connection_pool
+from www.orm import create_connection_pool, enable_query_cache, enable_row_counters
+from www.models import User, Blog, Comment
 from www.coreweb import add_routes, add_static
 
 logging.basicConfig(level=logging.INFO)
@@ -32,11 +33,19 @@ def init_jinja2(app, **kw):
     if path is None:
         path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
     logging.info('set jinja2 template path: %s' % path)
+    if kw.get('bytecode_cache', False):
+        # the compiled templates are shared by the workers and survive restarts
+        options['bytecode_cache'] = FileSystemBytecodeCache(kw.get('bytecode_cache_dir', None))
     env = Environment(loader=FileSystemLoader(path), **options)
     filters = kw.get('filters', None)
     if filters is not None:
         for name, f in filters.items():
             env.filters[name] = f
+    if kw.get('precompile', False):
+        names = env.list_templates(extensions=['html'])
+        for name in names:
+            env.get_template(name)
+        logging.info('precompiled %s templates' % len(names))
     app['__templating__'] = env
 
 
@@ -56,12 +65,19 @@ def datetime_filter(t):
 
 async def init(loop):
     await create_connection_pool(loop=loop, **configs.db)
+    if configs.query_cache.enabled:
+        enable_query_cache(maxsize=configs.query_cache.maxsize, ttl=configs.query_cache.ttl)
+    if configs.row_counter.backend:
+        await enable_row_counters(User, Blog, Comment, backend=configs.row_counter.backend)
 
-    from www.middleware import logger_factory, data_factory, auth_factory, response_factory
+    from www.middleware import logger_factory, compress_factory, page_cache_factory, data_factory, auth_factory, \
+        response_factory
     app = web.Application(loop=loop, middlewares=[
-        logger_factory, auth_factory, data_factory, response_factory
+        logger_factory, compress_factory, page_cache_factory, auth_factory, data_factory, response_factory
     ])
-    init_jinja2(app=app, filters=dict(datetime=datetime_filter))
+    init_jinja2(app=app, filters=dict(datetime=datetime_filter), auto_reload=configs.debug,
+                bytecode_cache=not configs.debug, bytecode_cache_dir=configs.templates.bytecode_cache_dir,
+                precompile=not configs.debug)
     add_static(app=app)
     add_routes(app=app, module_name='www.handlers')
     server = await loop.create_server(app.make_handler(), host='127.0.0.1', port=8080)